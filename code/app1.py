@@ -1,19 +1,17 @@
 import pandas as pd
 import logging
+from logconfig import setup_logging
+from ingest import read_input
+from memory_budget import MemoryBudget
 import os
 
 # === Step 1: Setup Logging ===
-logging.basicConfig(
-    filename='automation_log.txt',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 # === Step 2: Load CSV Data ===
 def load_data(filepath):
     try:
-        df = pd.read_csv(filepath)
+        df = read_input(filepath)
         logging.info("CSV file loaded successfully.")
         return df
     except FileNotFoundError:
@@ -57,6 +55,24 @@ def create_pivot_table(df):
         logging.error(f"Error creating pivot table: {e}")
         raise
 
+# === Step 4b: Create Pivot Table Within Memory Budget ===
+def create_pivot_table_chunked(filepath, budget):
+    try:
+        pivot = budget.pivot(
+            filepath,
+            values='PageValues',
+            index='VisitorType',
+            columns='Weekend',
+            aggfunc='mean',
+            fill_value=0,
+            transform=clean_data
+        )
+        logging.info("Pivot table created in chunks.")
+        return pivot
+    except Exception as e:
+        logging.error(f"Error creating chunked pivot table: {e}")
+        raise
+
 # === Step 5: Save Pivot Table ===
 def save_output(pivot_df, output_path):
     try:
@@ -72,9 +88,14 @@ def automate_workflow():
     output_path = 'pivot_output.csv'
 
     print("🔄 Starting automation...")
-    df = load_data(input_path)
-    df = clean_data(df)
-    pivot = create_pivot_table(df)
+    budget = MemoryBudget()
+    with budget.stage('load and pivot'):
+        if budget.fits(input_path):
+            df = load_data(input_path)
+            df = clean_data(df)
+            pivot = create_pivot_table(df)
+        else:
+            pivot = create_pivot_table_chunked(input_path, budget)
     save_output(pivot, output_path)
     print("✅ Automation complete. Output saved as:", output_path)
 
@@ -1,22 +1,19 @@
 import pandas as pd
 import logging
-import smtplib
-import ssl
+from logconfig import setup_logging
+from ingest import read_input
+from memory_budget import MemoryBudget
 from email.message import EmailMessage
 import os
+from outbox import enqueue_message
 
 # === SETUP LOGGING ===
-logging.basicConfig(
-    filename='automation_log.txt',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 # === STEP 1: Load CSV Data ===
 def load_data(filepath):
     try:
-        df = pd.read_csv(filepath)
+        df = read_input(filepath)
         logging.info("CSV file loaded successfully.")
         return df
     except FileNotFoundError:
@@ -58,6 +55,24 @@ def create_pivot_table(df):
         logging.error(f"Pivot table creation failed: {e}")
         raise
 
+# === STEP 3b: Create Pivot Table Within Memory Budget ===
+def create_pivot_table_chunked(filepath, budget):
+    try:
+        pivot = budget.pivot(
+            filepath,
+            values='PageValues',
+            index='VisitorType',
+            columns='Weekend',
+            aggfunc='mean',
+            fill_value=0,
+            transform=clean_data
+        )
+        logging.info("Pivot table created in chunks.")
+        return pivot
+    except Exception as e:
+        logging.error(f"Chunked pivot table creation failed: {e}")
+        raise
+
 # === STEP 4: Save to CSV ===
 def save_output(df, output_path):
     try:
@@ -68,7 +83,7 @@ def save_output(df, output_path):
         raise
 
 # === STEP 5: Send Email ===
-def send_email_report(sender_email, app_password, recipient_email, subject, body, attachment_path):
+def send_email_report(sender_email, recipient_email, subject, body, attachment_path):
     try:
         msg = EmailMessage()
         msg['Subject'] = subject
@@ -81,16 +96,13 @@ def send_email_report(sender_email, app_password, recipient_email, subject, body
             filename = os.path.basename(attachment_path)
             msg.add_attachment(data, maintype='application', subtype='octet-stream', filename=filename)
 
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465, context=context) as smtp:
-            smtp.login(sender_email, app_password)
-            smtp.send_message(msg)
+        enqueue_message(msg, transport='gmail')
 
-        logging.info("Email report sent successfully.")
-        print("📧 Email sent successfully.")
+        logging.info("Email report queued for delivery.")
+        print("📥 Email queued for delivery.")
     except Exception as e:
-        logging.error(f"Email sending failed: {e}")
-        print("❌ Failed to send email.")
+        logging.error(f"Queuing email failed: {e}")
+        print("❌ Failed to queue email.")
 
 # === MAIN WORKFLOW ===
 def automate_workflow():
@@ -98,19 +110,23 @@ def automate_workflow():
     output_file = 'pivot_output.csv'
 
     print("🔄 Starting automation...")
-    df = load_data(input_file)
-    df = clean_data(df)
-    pivot = create_pivot_table(df)
+    budget = MemoryBudget()
+    with budget.stage('load and pivot'):
+        if budget.fits(input_file):
+            df = load_data(input_file)
+            df = clean_data(df)
+            pivot = create_pivot_table(df)
+        else:
+            pivot = create_pivot_table_chunked(input_file, budget)
     save_output(pivot, output_file)
 
     # EMAIL CONFIGURATION
     sender_email = "sender email "
-    app_password = "gmail app password"  # Use Gmail App Password
     recipient_email = "@gmail.com"
     subject = "Daily Pivot Report - Online Shoppers Intention"
     body = "Please find attached the pivot table report generated today."
 
-    send_email_report(sender_email, app_password, recipient_email, subject, body, output_file)
+    send_email_report(sender_email, recipient_email, subject, body, output_file)
     print("✅ Automation complete.")
 
 # === Run Script ===
@@ -1,24 +1,21 @@
 import pandas as pd
 import logging
-import smtplib
-import ssl
+from logconfig import setup_logging
+from ingest import read_input
+from memory_budget import MemoryBudget
 from email.message import EmailMessage
 import os
+from outbox import enqueue_message
 from openpyxl.styles import Font
 from openpyxl import load_workbook
 
 # === LOGGING SETUP ===
-logging.basicConfig(
-    filename='automation_log.txt',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 # === LOAD CSV ===
 def load_data(filepath):
     try:
-        df = pd.read_csv(filepath)
+        df = read_input(filepath)
         logging.info("CSV file loaded successfully.")
         return df
     except Exception as e:
@@ -98,7 +95,7 @@ def get_email_list(filepath):
         return []
 
 # === SEND EMAIL ===
-def send_email_report(sender, password, recipients, subject, body, attachment):
+def send_email_report(sender, recipients, subject, body, attachment):
     try:
         if not recipients:
             logging.error("No valid recipients to send email.")
@@ -119,16 +116,13 @@ def send_email_report(sender, password, recipients, subject, body, attachment):
                 filename=os.path.basename(attachment)
             )
 
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465, context=context) as smtp:
-            smtp.login(sender, password)
-            smtp.send_message(msg)
+        enqueue_message(msg, transport='gmail')
 
-        logging.info("Email report sent successfully.")
-        print("📧 Email sent.")
+        logging.info("Email report queued for delivery.")
+        print("📥 Email queued.")
     except Exception as e:
-        logging.error(f"Email sending failed: {e}")
-        print("❌ Failed to send email.")
+        logging.error(f"Queuing email failed: {e}")
+        print("❌ Failed to queue email.")
 
 # === MAIN AUTOMATION WORKFLOW ===
 def automate_workflow():
@@ -139,18 +133,24 @@ def automate_workflow():
     print("🔄 Starting automation...")
 
     try:
-        df = load_data(input_csv)
-        clean_df = clean_data(df)
-        pivot_df = create_pivot_table(clean_df)
-        save_to_excel(clean_df, pivot_df, output_excel)
+        budget = MemoryBudget()
+        if not budget.fits(input_csv):
+            # The report ships the cleaned rows themselves, so this job has no chunked path
+            logging.warning(f"{input_csv} is loaded whole and will exceed the memory budget.")
+        with budget.stage('load and clean'):
+            df = load_data(input_csv)
+            clean_df = clean_data(df)
+        with budget.stage('pivot'):
+            pivot_df = create_pivot_table(clean_df)
+        with budget.stage('excel'):
+            save_to_excel(clean_df, pivot_df, output_excel)
 
         sender = "sender email id "
-        password = "Use Gmail App Password here "  # Use Gmail App Password here
         recipients = get_email_list(email_excel)
 
         subject = "📊 Daily Pivot Report - Online Shoppers Intention"
         body = "Hi,\n\nPlease find today's attached report.\n\nBest regards,\nAutomation Bot"
-        send_email_report(sender, password, recipients, subject, body, output_excel)
+        send_email_report(sender, recipients, subject, body, output_excel)
 
         print("✅ Automation complete.")
     except Exception as e:
@@ -1,17 +1,18 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-import smtplib
-from email.message import EmailMessage
-from pathlib import Path
 import schedule
 import time
 import os
+from ingest import read_input
+from logconfig import setup_logging
+from memory_budget import MemoryBudget
+from outbox import enqueue_message
+from report_packager import SUMMARY_TOP_ROWS, build_messages, save_report_excel, save_summary_excel
 
 # === CONFIGURATION ===
 CSV_FILE = 'online_shoppers_intention.csv'
 SENDER_EMAIL = 'sender@gmail.com'
-APP_PASSWORD = 'gmail app password '
 SUBJECT = "Automated Pivot & Analysis Report"
 BODY = "Attached are today's pivot report and visual analytics."
 RECIPIENTS = [
@@ -26,85 +27,135 @@ RECIPIENTS = [
     
 ]
 
-def run_analysis_and_send_email():
-    try:
-        sns.set(style="whitegrid")
-
+PIVOT_SPEC = dict(
+    index=['VisitorType', 'Weekend'],
+    values=['PageValues', 'BounceRates', 'ExitRates', 'Administrative_Duration'],
+    aggfunc=['mean', 'sum', 'count'],
+    margins=True,
+    margins_name='Grand Total'
+)
+
+# Chart name -> (chart data key, plot function)
+CHARTS = {
+    "visitor_pie_chart": ('visitor_counts', lambda counts: counts.plot.pie(
+        autopct='%1.1f%%', title='Visitor Type Distribution')),
+    "pagevalues_bar_chart": ('avg_pagevalues', lambda averages: averages.plot(
+        kind='bar', title='Avg PageValues by Visitor Type', color='skyblue')),
+    "exit_vs_bounce": ('exit_vs_bounce', lambda data: sns.lineplot(data=data, x='ExitRates', y='BounceRates')),
+    "correlation_heatmap": ('correlation', lambda corr: sns.heatmap(
+        corr, annot=True, cmap='coolwarm', fmt=".2f"))
+}
+
+# Chart data from the full frame; the streamed path builds the same keys from chunked aggregates
+FRAME_CHART_DATA = {
+    'visitor_counts': lambda df: df['VisitorType'].value_counts(),
+    'avg_pagevalues': lambda df: df.groupby('VisitorType')['PageValues'].mean(),
+    'exit_vs_bounce': lambda df: df,  # lineplot averages repeated x values and draws the 95% CI
+    'correlation': lambda df: df.corr(numeric_only=True),
+}
+
+setup_logging()
+
+def analyse_in_memory(budget):
+    """Whole-file path: returns the sorted rows, the pivot and the chart data."""
+    with budget.stage('load'):
         print("🔄 Loading CSV file...")
-        df = pd.read_csv(CSV_FILE)
+        df = read_input(CSV_FILE)
         print(f"✅ Loaded: {df.shape[0]} rows, {df.shape[1]} columns.")
 
-        print("🚨 Checking missing/negative values...")
-        print(df.isnull().sum().to_frame("Missing Values"))
-        print((df.select_dtypes(include='number') < 0).sum().to_frame("Negative Values"))
+    print("🚨 Checking missing/negative values...")
+    print(df.isnull().sum().to_frame("Missing Values"))
+    print((df.select_dtypes(include='number') < 0).sum().to_frame("Negative Values"))
 
+    with budget.stage('sort and pivot'):
         print("📌 Sorting by 'BounceRates'...")
         sorted_df = df.sort_values(by='BounceRates', ascending=False) if 'BounceRates' in df.columns else df.copy()
 
         print("📊 Creating pivot table...")
-        pivot = pd.pivot_table(
-            df,
-            index=['VisitorType', 'Weekend'],
-            values=['PageValues', 'BounceRates', 'ExitRates', 'Administrative_Duration'],
-            aggfunc=['mean', 'sum', 'count'],
-            margins=True,
-            margins_name='Grand Total'
-        )
+        pivot = pd.pivot_table(df, **PIVOT_SPEC)
+        chart_data = {key: build(df) for key, build in FRAME_CHART_DATA.items()}
+    return sorted_df, pivot, chart_data
+
+def analyse_in_chunks(budget):
+    """Streamed path for input over the memory budget: only aggregates and the top rows are kept."""
+    print("🔄 CSV file exceeds the memory budget; streaming it in chunks...")
+    with budget.stage('chunked checks'):
+        totals = budget.sum_over_chunks(CSV_FILE, lambda chunk: {
+            'rows': pd.Series({'rows': len(chunk)}),
+            'missing': chunk.isnull().sum(),
+            'negative': (chunk.select_dtypes(include='number') < 0).sum(),
+            'visitors': chunk['VisitorType'].value_counts(),
+        })
+        top_rows = None
+        for chunk in budget.iter_chunks(CSV_FILE):
+            candidates = chunk if top_rows is None else pd.concat([top_rows, chunk])
+            top_rows = candidates.nlargest(SUMMARY_TOP_ROWS, 'BounceRates')
+    total_rows = int(totals['rows'].iloc[0])
+    print(f"✅ Scanned: {total_rows} rows, {len(totals['missing'])} columns.")
+
+    print("🚨 Checking missing/negative values...")
+    print(totals['missing'].astype(int).to_frame("Missing Values"))
+    print(totals['negative'].astype(int).to_frame("Negative Values"))
+
+    print(f"📌 Keeping the top {len(top_rows)} rows by 'BounceRates'...")
+    print("📊 Creating pivot table...")
+    pivot = budget.pivot(CSV_FILE, **PIVOT_SPEC)
+
+    # Average PageValues per visitor type from the pivot's sums and counts
+    sums = pivot.drop(index=PIVOT_SPEC['margins_name'], level=0)[[('sum', 'PageValues'), ('count', 'PageValues')]]
+    sums = sums.groupby(level='VisitorType').sum()
+    # One mean per exit rate, so the line has no confidence band on this path
+    exit_vs_bounce = budget.pivot(CSV_FILE, values='BounceRates', index='ExitRates').reset_index()
+    chart_data = {
+        'visitor_counts': totals['visitors'].astype(int).sort_values(ascending=False),
+        'avg_pagevalues': (sums[('sum', 'PageValues')] / sums[('count', 'PageValues')]).rename('PageValues'),
+        'exit_vs_bounce': exit_vs_bounce,
+        'correlation': budget.corr(CSV_FILE),
+    }
+    return top_rows, total_rows, pivot, chart_data
+
+def create_charts(chart_data):
+    for name, (key, plot_func) in CHARTS.items():
+        plt.figure(figsize=(8, 6))
+        plot_func(chart_data[key])
+        plt.tight_layout()
+        plt.savefig(f"{name}.png")
+        plt.close()
+
+def run_analysis_and_send_email():
+    try:
+        sns.set(style="whitegrid")
+        budget = MemoryBudget()
+
+        if budget.fits(CSV_FILE):
+            sorted_df, pivot, chart_data = analyse_in_memory(budget)
+        else:
+            sorted_df = None
+            top_rows, total_rows, pivot, chart_data = analyse_in_chunks(budget)
 
         print("📈 Creating charts...")
-        charts = {
-            "visitor_pie_chart.png": lambda: df['VisitorType'].value_counts().plot.pie(
-                autopct='%1.1f%%', title='Visitor Type Distribution'),
-            "pagevalues_bar_chart.png": lambda: df.groupby('VisitorType')['PageValues'].mean().plot(
-                kind='bar', title='Avg PageValues by Visitor Type', color='skyblue'),
-            "exit_vs_bounce.png": lambda: sns.lineplot(data=df, x='ExitRates', y='BounceRates'),
-            "correlation_heatmap.png": lambda: sns.heatmap(
-                df.corr(numeric_only=True), annot=True, cmap='coolwarm', fmt=".2f")
-        }
-
-        for filename, plot_func in charts.items():
-            plt.figure(figsize=(8, 6))
-            plot_func()
-            plt.tight_layout()
-            plt.savefig(filename)
-            plt.close()
+        with budget.stage('charts'):
+            create_charts(chart_data)
 
         print("💾 Saving Excel file...")
-        with pd.ExcelWriter("outputexcelfile.xlsx", engine='openpyxl') as writer:
-            sorted_df.to_excel(writer, index=False, sheet_name='Sorted_Data')
-            pivot.to_excel(writer, sheet_name='Pivot_Insights')
-
-        print("📨 Composing email...")
-        msg = EmailMessage()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = ', '.join(RECIPIENTS)
-        msg['Subject'] = SUBJECT
-        msg.set_content(BODY)
-
-        attachments = [
-            "outputexcelfile.xlsx",
-            "visitor_pie_chart.png",
-            "pagevalues_bar_chart.png",
-            "exit_vs_bounce.png",
-            "correlation_heatmap.png"
-        ]
-
-        for file_path in attachments:
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-                file_name = Path(file_path).name
-                maintype = "application" if file_path.endswith('.xlsx') else "image"
-                subtype = "octet-stream" if file_path.endswith('.xlsx') else "png"
-                msg.add_attachment(file_data, maintype=maintype, subtype=subtype, filename=file_name)
-
-        print("📤 Sending email...")
+        with budget.stage('excel'):
+            if sorted_df is not None:
+                save_report_excel(sorted_df, pivot, "outputexcelfile.xlsx", max_memory=budget.headroom())
+            else:
+                save_summary_excel(top_rows, pivot, total_rows, "outputexcelfile.xlsx")
+
+        print("📨 Packaging attachments...")
+        attachments = ["outputexcelfile.xlsx"] + [f"{name}.png" for name in CHARTS]
+
+        messages = build_messages(SENDER_EMAIL, RECIPIENTS, SUBJECT, BODY, attachments)
+
+        print(f"📥 Queuing {len(messages)} email(s) for delivery...")
         try:
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-                smtp.login(SENDER_EMAIL, APP_PASSWORD)
-                smtp.send_message(msg)
-            print("✅ Email sent successfully.")
+            for msg in messages:
+                enqueue_message(msg, transport='gmail')
+            print("✅ Email queued.")
         except Exception as email_err:
-            print("❌ Email failed to send:", email_err)
+            print("❌ Email failed to queue:", email_err)
 
     except Exception as e:
         print("❌ Error occurred during analysis or report creation:", e)
@@ -115,8 +166,9 @@ def run_analysis_and_send_email():
 # ========================
 schedule.every().day.at("15:55").do(run_analysis_and_send_email)
 
-print("⏳ Scheduler started. Waiting for scheduled time...")
+if __name__ == "__main__":
+    print("⏳ Scheduler started. Waiting for scheduled time...")
 
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+    while True:
+        schedule.run_pending()
+        time.sleep(60)
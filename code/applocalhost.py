@@ -2,25 +2,22 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import logging
-import smtplib
-import ssl
+from logconfig import setup_logging
+from ingest import read_input
+from memory_budget import MemoryBudget
 import os
 import schedule
 import time
 from email.message import EmailMessage
+from outbox import enqueue_message
 
 # === SETUP LOGGING ===
-logging.basicConfig(
-    filename='automation_log.txt',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 # === Load Data ===
 def load_data(filepath):
     try:
-        df = pd.read_csv(filepath)
+        df = read_input(filepath)
         logging.info("CSV file loaded successfully.")
         return df
     except FileNotFoundError:
@@ -104,7 +101,7 @@ def get_recipient_email(df):
         raise
 
 # === Send Email ===
-def send_email_report(sender_email, app_password, recipient_email, subject, body, attachments):
+def send_email_report(sender_email, recipient_email, subject, body, attachments):
     try:
         msg = EmailMessage()
         msg['Subject'] = subject
@@ -118,16 +115,13 @@ def send_email_report(sender_email, app_password, recipient_email, subject, body
                 file_name = os.path.basename(path)
                 msg.add_attachment(file_data, maintype='application', subtype='octet-stream', filename=file_name)
 
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465, context=context) as smtp:
-            smtp.login(sender_email, app_password)
-            smtp.send_message(msg)
+        enqueue_message(msg, transport='gmail')
 
-        logging.info("Email sent successfully.")
-        print("📧 Email sent.")
+        logging.info("Email queued for delivery.")
+        print("📥 Email queued.")
     except Exception as e:
-        logging.error(f"Email failed: {e}")
-        print("❌ Failed to send email.")
+        logging.error(f"Email queuing failed: {e}")
+        print("❌ Failed to queue email.")
 
 # === Main Workflow ===
 def automate_workflow():
@@ -135,20 +129,26 @@ def automate_workflow():
     input_file = 'online_shoppers_intention.csv'
     output_file = 'pivot_output.csv'
 
-    df = load_data(input_file)
-    recipient_email = get_recipient_email(df)
-    df = clean_data(df)
-    pivot = create_pivot_table(df)
-    save_output(pivot, output_file)
-    create_visualizations(df)
+    budget = MemoryBudget()
+    if not budget.fits(input_file):
+        # The box plot needs every row, so this job has no chunked path
+        logging.warning(f"{input_file} is loaded whole and will exceed the memory budget.")
+    with budget.stage('load and clean'):
+        df = load_data(input_file)
+        recipient_email = get_recipient_email(df)
+        df = clean_data(df)
+    with budget.stage('pivot'):
+        pivot = create_pivot_table(df)
+        save_output(pivot, output_file)
+    with budget.stage('charts'):
+        create_visualizations(df)
 
     sender_email = "sender@gmail.com"
-    app_password = "gmail app password "
     subject = "Automated Pivot & Analysis Report"
     body = "Attached are today's pivot report and visual analytics."
 
     attachments = [output_file, "boxplot_pagevalues_by_revenue.png", "visitor_weekend_count.png"]
-    send_email_report(sender_email, app_password, recipient_email, subject, body, attachments)
+    send_email_report(sender_email, recipient_email, subject, body, attachments)
     print("✅ Workflow complete.")
 
 # === Schedule Automation ===
@@ -1,9 +1,11 @@
 import pandas as pd
 import logging
-import smtplib
-import ssl
+from logconfig import setup_logging
+from ingest import read_input
+from memory_budget import MemoryBudget
 from email.message import EmailMessage
 import os
+from outbox import enqueue_message
 import schedule
 import time
 from datetime import datetime
@@ -15,17 +17,11 @@ from datetime import datetime
 INPUT_CSV = 'online_shoppers_intention.csv'
 OUTPUT_CSV = 'pivot_output.csv'
 SENDER_EMAIL = 'sender@outlook.com'
-APP_PASSWORD = 'ylgaqytqhzsmslxb'
 RECIPIENT_EMAIL = 'recipent@gmail.com'
 EMAIL_SUBJECT = "Daily Pivot Report - Online Shoppers Intention"
 EMAIL_BODY = "Please find attached the pivot table report generated today."
 
-logging.basicConfig(
-    filename='automation_log.txt',
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 # ========================
 # FUNCTION DEFINITIONS
@@ -33,7 +29,7 @@ logging.basicConfig(
 
 def load_data(filepath):
     try:
-        df = pd.read_csv(filepath)
+        df = read_input(filepath)
         logging.info("✅ CSV loaded successfully.")
         return df
     except FileNotFoundError:
@@ -73,6 +69,23 @@ def create_pivot_table(df):
         logging.error(f"❌ Pivot creation failed: {e}")
         raise
 
+def create_pivot_table_chunked(filepath, budget):
+    try:
+        pivot = budget.pivot(
+            filepath,
+            values='PageValues',
+            index='VisitorType',
+            columns='Weekend',
+            aggfunc='mean',
+            fill_value=0,
+            transform=clean_data
+        )
+        logging.info("✅ Pivot table created in chunks.")
+        return pivot
+    except Exception as e:
+        logging.error(f"❌ Chunked pivot creation failed: {e}")
+        raise
+
 def save_csv(df, output_path):
     try:
         df.to_csv(output_path)
@@ -81,7 +94,7 @@ def save_csv(df, output_path):
         logging.error(f"❌ Error saving CSV: {e}")
         raise
 
-def send_email(sender, password, recipient, subject, body, attachment_path):
+def send_email(sender, recipient, subject, body, attachment_path):
     try:
         msg = EmailMessage()
         msg['From'] = sender
@@ -94,17 +107,13 @@ def send_email(sender, password, recipient, subject, body, attachment_path):
             filename = os.path.basename(attachment_path)
             msg.add_attachment(file_data, maintype='application', subtype='octet-stream', filename=filename)
 
-        context = ssl.create_default_context()
-        with smtplib.SMTP('smtp.office365.com', 587) as smtp:
-            smtp.starttls(context=context)
-            smtp.login(sender, password)
-            smtp.send_message(msg)
+        enqueue_message(msg, transport='outlook')
 
-        logging.info("✅ Email sent successfully.")
-        print("📧 Email sent successfully.")
+        logging.info("✅ Email queued for delivery.")
+        print("📥 Email queued for delivery.")
     except Exception as e:
-        logging.error(f"❌ Failed to send email: {e}")
-        print("❌ Failed to send email:", e)
+        logging.error(f"❌ Failed to queue email: {e}")
+        print("❌ Failed to queue email:", e)
 
 # ========================
 # MAIN AUTOMATION WORKFLOW
@@ -114,11 +123,16 @@ def run_automation():
     print(f"🔄 Running automation at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}...")
 
     try:
-        df = load_data(INPUT_CSV)
-        cleaned_df = clean_data(df)
-        pivot_df = create_pivot_table(cleaned_df)
+        budget = MemoryBudget()
+        with budget.stage('load and pivot'):
+            if budget.fits(INPUT_CSV):
+                df = load_data(INPUT_CSV)
+                cleaned_df = clean_data(df)
+                pivot_df = create_pivot_table(cleaned_df)
+            else:
+                pivot_df = create_pivot_table_chunked(INPUT_CSV, budget)
         save_csv(pivot_df, OUTPUT_CSV)
-        send_email(SENDER_EMAIL, APP_PASSWORD, RECIPIENT_EMAIL, EMAIL_SUBJECT, EMAIL_BODY, OUTPUT_CSV)
+        send_email(SENDER_EMAIL, RECIPIENT_EMAIL, EMAIL_SUBJECT, EMAIL_BODY, OUTPUT_CSV)
 
         print("✅ Automation complete.")
     except Exception as err:
@@ -131,9 +145,10 @@ def run_automation():
 # Set time to run the automation daily (24-hour format, e.g. "09:00" for 9 AM)
 schedule.every().day.at("14:57").do(run_automation)
 
-print("⏳ Scheduler started. Waiting for scheduled time...")
+if __name__ == "__main__":
+    print("⏳ Scheduler started. Waiting for scheduled time...")
 
-# Infinite loop to keep the script running
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+    # Infinite loop to keep the script running
+    while True:
+        schedule.run_pending()
+        time.sleep(60)
@@ -0,0 +1,99 @@
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from logconfig import configure_worker_logging, get_worker_log_queue
+
+# Every reader (whole-file, chunked and the daemon's incremental tail) uses the
+# same parser so the same input always gets the same dtypes. The C engine is
+# the one that supports chunked iteration.
+CSV_ENGINE = 'c'
+
+# === SHARD DISCOVERY ===
+SHARD_PATTERNS = ('*.csv', '*.csv.gz', '*.csv.zst', '*.csv.zstd')
+COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+
+
+def compression_for(path):
+    return COMPRESSION.get(os.path.splitext(path)[1], 'infer')
+
+
+def is_sharded(source):
+    return os.path.isdir(source) or glob.has_magic(source)
+
+
+def list_shards(source):
+    """Expand a file path, glob or directory into a sorted list of shard paths."""
+    if os.path.isdir(source):
+        paths = set()
+        for pattern in SHARD_PATTERNS:
+            paths.update(glob.glob(os.path.join(source, pattern)))
+        paths = sorted(paths)
+    elif glob.has_magic(source):
+        paths = sorted(glob.glob(source))
+    else:
+        return [source]
+
+    if not paths:
+        raise FileNotFoundError(f"No input shards match: {source}")
+    return paths
+
+
+# === SHARD PARSING ===
+def read_shard(path):
+    """Parse one (optionally gzip/zstd compressed) CSV shard.
+
+    Returns the frame together with the on-disk size and parse time so the
+    caller can report throughput.
+    """
+    start = time.perf_counter()
+    df = pd.read_csv(path, compression=compression_for(path), engine=CSV_ENGINE)
+    return df, os.path.getsize(path), time.perf_counter() - start
+
+
+def _log_shard(path, rows, size, seconds):
+    mb = size / (1024 * 1024)
+    rate = mb / seconds if seconds else float('inf')
+    logging.info(f"Shard {os.path.basename(path)}: {rows} rows, {mb:.1f} MB in {seconds:.2f}s ({rate:.1f} MB/s).")
+
+
+def read_shards(paths, max_workers=None):
+    """Parse shards in parallel, returning ``{path: DataFrame}`` in input order.
+
+    Each shard is parsed in its own process. The parsed frame is pickled back
+    to the parent, which costs one extra copy per shard, but the C parser holds
+    the GIL for much of its work, so threads would not scale with cores.
+    Workers log through a multiprocessing queue to the parent's log file.
+    """
+    if len(paths) == 1:
+        df, size, seconds = read_shard(paths[0])
+        _log_shard(paths[0], len(df), size, seconds)
+        return {paths[0]: df}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    frames = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=configure_worker_logging,
+                             initargs=(get_worker_log_queue(),)) as pool:
+        for path, (df, size, seconds) in zip(paths, pool.map(read_shard, paths)):
+            _log_shard(path, len(df), size, seconds)
+            frames[path] = df
+    return frames
+
+
+def read_input(source, max_workers=None):
+    """Load a single CSV, a glob of shards or a directory of shards into one frame."""
+    start = time.perf_counter()
+    paths = list_shards(source)
+    frames = read_shards(paths, max_workers=max_workers)
+
+    # Single concat at the end: one copy into the result instead of one per shard
+    df = frames[paths[0]] if len(frames) == 1 else pd.concat(frames.values(), ignore_index=True)
+
+    total_mb = sum(os.path.getsize(p) for p in paths) / (1024 * 1024)
+    elapsed = time.perf_counter() - start
+    logging.info(f"Ingested {len(paths)} shard(s), {len(df)} rows, {total_mb:.1f} MB in {elapsed:.2f}s.")
+    return df
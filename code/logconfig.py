@@ -0,0 +1,253 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None
+
+# Windows cannot rename a file another process has open, so writers there only
+# hold the log open while writing a record
+CLOSE_AFTER_WRITE = msvcrt is not None
+
+# === DEFAULTS ===
+LOG_FILE = 'automation_log.txt'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+_listener = None
+_log_queue = None
+_worker_listener = None
+_worker_queue = None
+
+
+# === JSON LINES FORMAT ===
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            # QueueHandler.prepare has already folded any traceback into the message
+            'message': record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# === COMPRESSED ROTATION ===
+def _gzip_namer(name):
+    return name + '.gz'
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+# === CROSS-PROCESS FILE LOCKING ===
+class _InterProcessLockMixin:
+    """Serialises writes and rollovers between processes sharing one log file.
+
+    Each scheduler process runs its own writer thread, so the writers take a
+    lock on a sidecar file (``flock`` on POSIX, ``msvcrt.locking`` on Windows)
+    and reopen the log if another process has rotated it underneath them.
+    """
+
+    def _setup_lock(self):
+        self._lock_path = self.baseFilename + '.lock'
+        self._lock_stream = open(self._lock_path, 'a') if fcntl or msvcrt else None
+        self._file_id = None
+        if self.stream is not None:
+            self._remember_file()
+            if CLOSE_AFTER_WRITE:
+                self._close_stream()
+
+    @contextmanager
+    def _interprocess_lock(self):
+        if self._lock_stream is None:
+            yield
+            return
+        if fcntl is not None:
+            fcntl.flock(self._lock_stream, fcntl.LOCK_EX)
+        else:
+            self._lock_stream.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._lock_stream.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ten one-second retries; keep waiting
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._lock_stream, fcntl.LOCK_UN)
+            else:
+                self._lock_stream.seek(0)
+                msvcrt.locking(self._lock_stream.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _remember_file(self):
+        current = os.fstat(self.stream.fileno())
+        self._file_id = (current.st_ino, current.st_dev)
+
+    def _close_stream(self):
+        stream, self.stream = self.stream, None
+        stream.close()
+
+    def _reopen_if_rotated(self):
+        if self._file_id is None:
+            return
+        try:
+            on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            on_disk = None
+        if on_disk is None or (on_disk.st_ino, on_disk.st_dev) != self._file_id:
+            if self.stream is not None:
+                self._close_stream()
+                self.stream = self._open()
+            if hasattr(self, 'rolloverAt'):
+                self.rolloverAt = self.computeRollover(int(time.time()))
+
+    def emit(self, record):
+        # Errors must not escape: they would kill the QueueListener thread and
+        # every later record would pile up in the queue unwritten
+        try:
+            with self._interprocess_lock():
+                self._reopen_if_rotated()
+                super().emit(record)
+                if self.stream is not None:
+                    self._remember_file()
+                    if CLOSE_AFTER_WRITE:
+                        self._close_stream()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        if self._lock_stream is not None:
+            self._lock_stream.close()
+            self._lock_stream = None
+
+
+class LockedRotatingFileHandler(_InterProcessLockMixin, logging.handlers.RotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._setup_lock()
+
+
+class LockedTimedRotatingFileHandler(_InterProcessLockMixin, logging.handlers.TimedRotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._setup_lock()
+
+
+# === SETUP ===
+def _build_file_handler(filename, max_bytes, backup_count, when, compress, json_lines):
+    if when:
+        handler = LockedTimedRotatingFileHandler(
+            filename, when=when, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = LockedRotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+
+    handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def setup_logging(filename=LOG_FILE, level=logging.INFO, max_bytes=MAX_BYTES,
+                  backup_count=BACKUP_COUNT, when=None, compress=True, json_lines=False):
+    """Route all logging through a queue drained by a single writer thread.
+
+    Callers only pay for a queue put; formatting, disk I/O and rotation happen
+    on the listener thread. ``when`` switches from size-based to time-based
+    rotation (same values as ``TimedRotatingFileHandler``). Only the first
+    call in a process takes effect.
+    """
+    global _listener, _log_queue
+
+    if _listener is not None:
+        return
+
+    file_handler = _build_file_handler(filename, max_bytes, backup_count, when, compress, json_lines)
+    _log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_log_queue, file_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    root.setLevel(level)
+
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+# === PROCESS POOLS ===
+def get_worker_log_queue():
+    """A ``multiprocessing.Queue`` that worker processes can log through.
+
+    Pool workers inherit the root ``QueueHandler``, but it points at this
+    process's in-memory queue, which nothing drains in the child. The first
+    call starts a second listener that feeds this queue into the same file
+    handler. Returns None if ``setup_logging`` has not been called.
+    """
+    global _worker_listener, _worker_queue
+
+    if _listener is None:
+        return None
+    if _worker_listener is None:
+        _worker_queue = multiprocessing.Queue(-1)
+        _worker_listener = logging.handlers.QueueListener(
+            _worker_queue, *_listener.handlers, respect_handler_level=True)
+        _worker_listener.start()
+    return _worker_queue
+
+
+def configure_worker_logging(log_queue, level=logging.INFO):
+    """Pool initializer: forward the worker's records to the parent's writer."""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if log_queue is not None:
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def shutdown_logging():
+    """Flush queued records and close the log file. Safe to call more than once."""
+    global _listener, _log_queue, _worker_listener, _worker_queue
+
+    if _listener is None:
+        return
+    if _worker_listener is not None:
+        _worker_listener.stop()
+        _worker_queue.close()
+        _worker_queue.join_thread()
+        _worker_listener = None
+        _worker_queue = None
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _log_queue = None
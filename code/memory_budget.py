@@ -0,0 +1,351 @@
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from ingest import CSV_ENGINE, compression_for, list_shards
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ========================
+# CONFIGURATION
+# ========================
+
+MEMORY_BUDGET = os.environ.get('REPORT_MEMORY_BUDGET', '512MB')
+SAMPLE_ROWS = 2000
+MIN_CHUNK_ROWS = 1000
+CHUNK_FRACTION = 0.25      # share of the free budget one chunk may use
+SPILL_FRACTION = 0.1       # spill partial aggregates once they use this share of the budget
+LOAD_OVERHEAD = 3          # cleaning and pivoting hold roughly three copies of the frame
+COMPRESSED_EXPANSION = 5   # assumed text/compressed size ratio for gzip/zstd shards
+FOLD_EVERY = 32            # merge in-memory partial aggregates after this many chunks
+SPILL_PARTITIONS = 16      # spilled partials are hash-partitioned by group key into this many files
+STAGE_SAMPLE_SECONDS = 0.05
+
+PARTIAL_STATS = {'mean': ('sum', 'count'), 'sum': ('sum',), 'count': ('count',),
+                 'min': ('min',), 'max': ('max',)}
+COMBINE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+def parse_size(text):
+    """Parse sizes like ``'512MB'``, ``'2 GiB'`` or a plain byte count."""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([kmgt]?)i?b?\s*', str(text).lower())
+    if not match:
+        raise ValueError(f"Invalid memory size: {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' kmgt'.index(unit or ' '))
+
+
+def max_rss():
+    """Highest RSS this process has reached, in bytes (None if unavailable)."""
+    if resource is None:
+        return None
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def current_rss():
+    """Resident set size of this process in bytes (0 if it cannot be read)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    return max_rss() or 0
+
+
+# ========================
+# BUDGET GOVERNOR
+# ========================
+
+class MemoryBudget:
+    """Chooses chunk sizes from observed row sizes and tracks RSS against a limit."""
+
+    def __init__(self, limit=MEMORY_BUDGET):
+        self.limit = parse_size(limit)
+        self.peak_rss = current_rss()
+
+    def check(self):
+        rss = current_rss()
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def headroom(self):
+        return max(self.limit - self.check(), 0)
+
+    @contextmanager
+    def stage(self, name):
+        """Log a stage's time and RSS, including its peak.
+
+        RSS is sampled on a background thread while the stage runs. A rise in
+        ``ru_maxrss`` during the stage also counts, to catch spikes between samples.
+        """
+        start_rss = self.check()
+        start_max = max_rss()
+        stage_peak = [start_rss]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(STAGE_SAMPLE_SECONDS):
+                stage_peak[0] = max(stage_peak[0], current_rss())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            done.set()
+            sampler.join()
+
+        rss = self.check()
+        peak = max(stage_peak[0], rss)
+        end_max = max_rss()
+        if end_max is not None and end_max > start_max:
+            peak = max(peak, end_max)
+        self.peak_rss = max(self.peak_rss, peak)
+        logging.info(f"Stage {name}: {time.perf_counter() - start:.2f}s, RSS {start_rss / 2**20:.0f} -> "
+                     f"{rss / 2**20:.0f} MB (stage peak {peak / 2**20:.0f} MB, budget {self.limit / 2**20:.0f} MB).")
+        if peak > self.limit:
+            logging.warning(f"Stage {name} exceeded the memory budget.")
+
+    def estimate_frame_bytes(self, path):
+        """Estimate the in-memory size of a whole CSV from a parsed sample."""
+        compression = compression_for(path)
+        sample = pd.read_csv(path, nrows=SAMPLE_ROWS, compression=compression, engine=CSV_ENGINE)
+        if sample.empty:
+            return 0
+
+        if compression == 'infer':
+            with open(path, 'rb') as f:
+                sample_text = sum(len(line) for _, line in zip(range(len(sample) + 1), f))
+            expansion = sample.memory_usage(deep=True).sum() / max(sample_text, 1)
+            return int(os.path.getsize(path) * expansion)
+        bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+        text_per_row = 1 + sum(len(str(v)) + 1 for v in sample.iloc[0])
+        return int(os.path.getsize(path) * COMPRESSED_EXPANSION / text_per_row * bytes_per_row)
+
+    def fits(self, source):
+        """True when loading ``source`` whole stays inside the budget."""
+        estimate = sum(self.estimate_frame_bytes(p) for p in list_shards(source)) * LOAD_OVERHEAD
+        fits = estimate <= self.headroom()
+        logging.info(f"Estimated {estimate / 2**20:.0f} MB to load {source} in memory; "
+                     f"{'loading whole' if fits else 'streaming in chunks'}.")
+        return fits
+
+    def _chunk_rows(self, bytes_per_row):
+        rows = int(self.headroom() * CHUNK_FRACTION / max(bytes_per_row, 1))
+        return max(rows, MIN_CHUNK_ROWS)
+
+    def iter_chunks(self, source, transform=None):
+        """Yield frames from ``source``, resizing each chunk to the remaining headroom.
+
+        The next chunk size is recomputed from the measured memory of the
+        previous chunk, so wide or string-heavy rows get smaller chunks.
+        """
+        for path in list_shards(source):
+            with pd.read_csv(path, iterator=True, compression=compression_for(path),
+                             engine=CSV_ENGINE) as reader:
+                rows = MIN_CHUNK_ROWS
+                while True:
+                    try:
+                        chunk = reader.get_chunk(rows)
+                    except StopIteration:
+                        break
+                    bytes_per_row = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+                    if transform is not None:
+                        chunk = transform(chunk)
+                    yield chunk
+                    rows = self._chunk_rows(bytes_per_row)
+
+    # ========================
+    # CHUNKED PIVOT
+    # ========================
+
+    def pivot(self, source, values, index, columns=None, aggfunc='mean', fill_value=None,
+              margins=False, margins_name='All', transform=None):
+        """Out-of-core equivalent of ``pd.pivot_table`` for mean/sum/count/min/max.
+
+        Each chunk is reduced to per-group partial statistics; chunk memory
+        itself is bounded by ``iter_chunks``. Partials are O(groups), so they
+        are only spilled when a high-cardinality index makes them a sizeable
+        share of the budget. Spills are hash-partitioned by group key and
+        merged back one partition at a time, so duplicate partials of the same
+        group are never all in memory at once. The result itself still has one
+        row per group. ``margins`` is supported for pivots without ``columns``.
+        """
+        value_cols = [values] if isinstance(values, str) else list(values)
+        index_cols = [index] if isinstance(index, str) else list(index)
+        column_cols = [] if columns is None else [columns] if isinstance(columns, str) else list(columns)
+        aggfuncs = [aggfunc] if isinstance(aggfunc, str) else list(aggfunc)
+        unsupported = [a for a in aggfuncs if a not in PARTIAL_STATS]
+        if unsupported:
+            raise ValueError(f"Unsupported aggfunc for chunked pivot: {', '.join(unsupported)}")
+        if margins and column_cols:
+            raise ValueError("Chunked pivot supports margins only without columns")
+
+        keys = index_cols + column_cols
+        stats = sorted({s for a in aggfuncs for s in PARTIAL_STATS[a]})
+        combine_spec = {(v, s): COMBINE[s] for v in value_cols for s in stats}
+
+        def combine(frames):
+            return pd.concat(frames).groupby(level=keys, sort=False).agg(combine_spec)
+
+        partials, margin_parts = [], []
+        spill_dir = None
+        try:
+            with self.stage('chunked pivot'):
+                for chunk in self.iter_chunks(source, transform):
+                    partials.append(chunk.groupby(keys, sort=False)[value_cols].agg(stats))
+                    if margins:
+                        # pd.pivot_table builds the margin only from rows with no missing key or value
+                        complete = chunk[keys + value_cols].dropna()
+                        margin_parts.append(complete[value_cols].agg(stats).unstack())
+                    if len(partials) >= FOLD_EVERY:
+                        partials = [combine(partials)]
+                    partial_bytes = sum(p.memory_usage(deep=True).sum() for p in partials)
+                    if partial_bytes >= self.limit * SPILL_FRACTION:
+                        spill_dir = spill_dir or tempfile.mkdtemp(prefix='pivot_spill_')
+                        for part_id, part in _partition(combine(partials)):
+                            with open(os.path.join(spill_dir, f'{part_id}.pkl'), 'ab') as f:
+                                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        partials = []
+                        logging.info(f"Spilled {partial_bytes / 2**20:.1f} MB of partial aggregates to {spill_dir}.")
+
+                merged = combine(partials) if partials else None
+                if spill_dir is not None:
+                    merged = _merge_spilled(spill_dir, merged, combine)
+
+            if merged is None:
+                raise ValueError(f"No rows found in {source}")
+            merged = merged.sort_index()
+            if margins:
+                totals = pd.DataFrame(margin_parts).agg(combine_spec).to_frame().T
+                totals.index = pd.MultiIndex.from_tuples([(margins_name,) + ('',) * (len(keys) - 1)],
+                                                         names=keys) if len(keys) > 1 \
+                    else pd.Index([margins_name], name=keys[0])
+                merged = pd.concat([merged, totals])
+            return _finalize_pivot(merged, values, value_cols, column_cols, aggfuncs,
+                                   isinstance(aggfunc, str), fill_value)
+        except Exception as e:
+            logging.error(f"Chunked pivot failed: {e}")
+            raise
+        finally:
+            if spill_dir is not None:
+                shutil.rmtree(spill_dir, ignore_errors=True)
+
+    # ========================
+    # OTHER CHUNKED REDUCTIONS
+    # ========================
+
+    def sum_over_chunks(self, source, func, transform=None):
+        """Add up ``func(chunk)`` over all chunks; ``func`` returns a dict of Series."""
+        totals = {}
+        for chunk in self.iter_chunks(source, transform):
+            for name, series in func(chunk).items():
+                totals[name] = series if name not in totals else totals[name].add(series, fill_value=0)
+        return totals
+
+    def corr(self, source, transform=None):
+        """Chunked ``df.corr(numeric_only=True)`` from running sums and cross-products.
+
+        Sums are taken pairwise over rows where both columns are present, as
+        pandas does. Values are shifted by the first chunk's means to keep the
+        sums well conditioned.
+        """
+        columns = shift = None
+        with self.stage('chunked correlation'):
+            for chunk in self.iter_chunks(source, transform):
+                numeric = chunk.select_dtypes(include=['number', 'bool'])
+                if columns is None:
+                    columns = numeric.columns
+                    shift = numeric.astype(float).mean().fillna(0).to_numpy()
+                    k = len(columns)
+                    n, sx, sxx, sxy = (np.zeros((k, k)) for _ in range(4))
+                x = numeric[columns].to_numpy(dtype=float) - shift
+                present = ~np.isnan(x)
+                x0 = np.where(present, x, 0.0)
+                m = present.astype(float)
+                n += m.T @ m
+                sx += x0.T @ m          # sx[i, j]: sum of x_i where x_j is also present
+                sxx += (x0 * x0).T @ m
+                sxy += x0.T @ x0
+
+        if columns is None:
+            raise ValueError(f"No rows found in {source}")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * sxy - sx * sx.T
+            var = (n * sxx - sx ** 2) * (n * sxx.T - sx.T ** 2)
+            corr = np.clip(cov / np.sqrt(var), -1, 1)
+        corr[n < 2] = np.nan
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+def _partition(frame):
+    codes = pd.util.hash_pandas_object(frame.index, index=False).to_numpy() % SPILL_PARTITIONS
+    return frame.groupby(codes, sort=False)
+
+
+def _merge_spilled(spill_dir, in_memory, combine):
+    # Each partition file holds every spilled run for its share of the groups
+    pending = dict(iter(_partition(in_memory))) if in_memory is not None else {}
+    merged = []
+    for part_id in range(SPILL_PARTITIONS):
+        runs = [pending.pop(part_id)] if part_id in pending else []
+        path = os.path.join(spill_dir, f'{part_id}.pkl')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        runs.append(pickle.load(f))
+                    except EOFError:
+                        break
+        if runs:
+            merged.append(combine(runs))
+        del runs
+
+    result = pd.concat(merged)
+    if result.index.has_duplicates:
+        # A key parsed with a different dtype in another chunk hashes differently
+        result = combine([result])
+    return result
+
+
+def _finalize_pivot(merged, values, value_cols, column_cols, aggfuncs, single_agg, fill_value):
+    # Mirror pd.pivot_table: one sorted table per aggfunc, concatenated in aggfunc order
+    results = {}
+    for agg in aggfuncs:
+        if agg == 'mean':
+            frame = merged.xs('sum', axis=1, level=1) / merged.xs('count', axis=1, level=1)
+        else:
+            frame = merged.xs(agg, axis=1, level=1)
+        frame = frame[value_cols]
+        if column_cols:
+            frame = frame.unstack(column_cols)
+        frame = frame.dropna(how='all').dropna(axis=1, how='all')
+        if fill_value is not None:
+            frame = frame.fillna(fill_value)
+        if isinstance(values, str) and column_cols:
+            frame = frame[values]
+        results[agg] = frame.sort_index(axis=1)
+
+    return results[aggfuncs[0]] if single_agg else pd.concat(results, axis=1)
@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import logging
+import os
+import smtplib
+import sqlite3
+import ssl
+import time
+import uuid
+from datetime import date
+from email import policy
+from email.parser import BytesParser
+
+from logconfig import setup_logging
+
+# ========================
+# CONFIGURATION
+# ========================
+
+OUTBOX_DB = os.environ.get('OUTBOX_DB', 'outbox.sqlite3')
+BATCH_SIZE = 20
+POLL_SECONDS = 10
+LEASE_SECONDS = 300         # renewed before every send, so it only has to cover one message
+SMTP_TIMEOUT_SECONDS = 60
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+CONNECT_RETRY_SECONDS = 300  # wait after a failed connect/login before trying that transport again
+
+# name -> (host, port, security)
+TRANSPORTS = {
+    'gmail': ('smtp.gmail.com', 465, 'ssl'),
+    'outlook': ('smtp.office365.com', 587, 'starttls'),
+    'localhost': ('localhost', 1025, 'plain'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    transport TEXT NOT NULL,
+    message BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    lease_token TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+# ========================
+# DATABASE
+# ========================
+
+def connect(db_path=OUTBOX_DB):
+    # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(outbox)')}
+    if 'lease_token' not in columns:
+        conn.execute('ALTER TABLE outbox ADD COLUMN lease_token TEXT')
+    return conn
+
+
+def idempotency_key_for(msg):
+    """Derive a stable key from the message content and today's date.
+
+    MIME boundaries are random, so the key hashes the addressing headers and
+    decoded part payloads rather than the serialised message. Re-running a
+    job on the same day with the same output enqueues nothing new.
+    """
+    digest = hashlib.sha256()
+    for header in ('From', 'To', 'Cc', 'Subject'):
+        digest.update(f"{header}:{msg.get(header, '')}\n".encode('utf-8'))
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        digest.update((part.get_filename() or '').encode('utf-8'))
+        digest.update(part.get_payload(decode=True) or b'')
+    digest.update(date.today().isoformat().encode('ascii'))
+    return digest.hexdigest()
+
+
+# ========================
+# PRODUCER SIDE
+# ========================
+
+def enqueue_message(msg, transport, idempotency_key=None, db_path=OUTBOX_DB):
+    """Persist a finished message for the delivery worker and return its key.
+
+    Returns as soon as the row is committed; SMTP latency or failures never
+    reach the caller. Enqueuing an already-known key is a no-op.
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport: {transport}")
+
+    try:
+        key = idempotency_key or idempotency_key_for(msg)
+        # A deterministic Message-ID lets mail clients drop the duplicate if a
+        # crash forces a resend after the server already accepted the message
+        if 'Message-ID' in msg:
+            del msg['Message-ID']
+        msg['Message-ID'] = f"<{key[:32]}@outbox.local>"
+
+        conn = connect(db_path)
+        try:
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, transport, message, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, transport, msg.as_bytes(), now, now)
+            )
+        finally:
+            conn.close()
+
+        if cursor.rowcount:
+            logging.info(f"Queued email '{msg['Subject']}' for {transport} delivery ({key[:12]}).")
+        else:
+            logging.info(f"Email '{msg['Subject']}' already queued ({key[:12]}); skipped.")
+        return key
+    except Exception as e:
+        logging.error(f"Failed to queue email: {e}")
+        raise
+
+
+# ========================
+# DELIVERY WORKER
+# ========================
+
+def credentials_for(transport):
+    """Per-provider login from ``SMTP_<TRANSPORT>_USER`` / ``SMTP_<TRANSPORT>_PASSWORD``."""
+    prefix = f"SMTP_{transport.upper()}_"
+    return os.environ.get(prefix + 'USER'), os.environ.get(prefix + 'PASSWORD')
+
+
+def claim_batch(conn, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+    """Lease due messages to this worker and return ``(token, rows)``.
+
+    Rows stuck in 'sending' whose lease ran out belong to a worker that
+    crashed or stalled mid-batch and are picked up again. The attempt is
+    counted when the row is claimed, so a message that keeps crashing the
+    worker still runs out of attempts.
+    """
+    now = time.time()
+    token = uuid.uuid4().hex
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            "UPDATE outbox SET status = 'failed', lease_until = NULL, "
+            "last_error = COALESCE(last_error, 'worker lost lease while sending') "
+            "WHERE status = 'sending' AND lease_until < ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS)
+        )
+        rows = conn.execute(
+            "SELECT id, idempotency_key, transport, message, attempts + 1 FROM outbox "
+            "WHERE (status = 'pending' AND next_attempt_at <= ?) "
+            "   OR (status = 'sending' AND lease_until < ?) "
+            "ORDER BY id LIMIT ?",
+            (now, now, batch_size)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET status = 'sending', attempts = attempts + 1, lease_until = ?, lease_token = ? "
+            "WHERE id = ?",
+            [(now + lease_seconds, token, row[0]) for row in rows]
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return token, rows
+
+
+def _renew_lease(conn, row_id, token, lease_seconds=LEASE_SECONDS):
+    """Extend the lease before a send. False if another worker has taken the row over."""
+    cursor = conn.execute(
+        "UPDATE outbox SET lease_until = ? WHERE id = ? AND status = 'sending' AND lease_token = ?",
+        (time.time() + lease_seconds, row_id, token)
+    )
+    return cursor.rowcount == 1
+
+
+def _mark_sent(conn, row_id, token):
+    conn.execute(
+        "UPDATE outbox SET status = 'sent', sent_at = ?, lease_until = NULL, last_error = NULL "
+        "WHERE id = ? AND lease_token = ?",
+        (time.time(), row_id, token)
+    )
+
+
+def _mark_failed(conn, row_id, token, attempts, error):
+    if attempts >= MAX_ATTEMPTS:
+        status, next_attempt = 'failed', time.time()
+    else:
+        delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+        status, next_attempt = 'pending', time.time() + delay
+    conn.execute(
+        "UPDATE outbox SET status = ?, next_attempt_at = ?, lease_until = NULL, last_error = ? "
+        "WHERE id = ? AND lease_token = ?",
+        (status, next_attempt, str(error), row_id, token)
+    )
+    return status
+
+
+def _release_unsent(conn, row_ids, token, error, delay=CONNECT_RETRY_SECONDS):
+    """Return claimed rows to 'pending' without using up an attempt."""
+    cursor = conn.executemany(
+        "UPDATE outbox SET status = 'pending', attempts = attempts - 1, next_attempt_at = ?, "
+        "lease_until = NULL, last_error = ? WHERE id = ? AND status = 'sending' AND lease_token = ?",
+        [(time.time() + delay, str(error), row_id, token) for row_id in row_ids]
+    )
+    return cursor.rowcount
+
+
+def open_smtp(transport, user, password):
+    host, port, security = TRANSPORTS[transport]
+    context = ssl.create_default_context()
+    if security == 'ssl':
+        smtp = smtplib.SMTP_SSL(host, port, context=context, timeout=SMTP_TIMEOUT_SECONDS)
+    else:
+        smtp = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT_SECONDS)
+    try:
+        if security == 'starttls':
+            smtp.starttls(context=context)
+        if password:
+            smtp.login(user, password)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+def _close_quietly(smtp):
+    try:
+        smtp.quit()
+    except Exception:
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+
+def deliver_batch(conn, token, rows):
+    """Send claimed rows, one SMTP session per transport. Returns (sent, failed).
+
+    If connecting or logging in fails, the message is not at fault: the
+    transport's remaining rows go back to 'pending' with their attempt
+    refunded, and the transport is retried after ``CONNECT_RETRY_SECONDS``.
+    """
+    sent = failed = 0
+    by_transport = {}
+    for row in rows:
+        by_transport.setdefault(row[2], []).append(row)
+
+    for transport, batch in by_transport.items():
+        user, password = credentials_for(transport)
+        smtp = None
+        try:
+            for position, (row_id, key, _, raw, attempts) in enumerate(batch):
+                if not _renew_lease(conn, row_id, token):
+                    logging.warning(f"Lease on email {key[:12]} expired and was reclaimed; skipping.")
+                    continue
+                msg = BytesParser(policy=policy.default).parsebytes(raw)
+                if smtp is None:
+                    try:
+                        smtp = open_smtp(transport, user or str(msg['From']), password)
+                    except Exception as e:
+                        released = _release_unsent(conn, [row[0] for row in batch[position:]], token, e)
+                        logging.error(f"Could not connect to {transport}: {e}; {released} email(s) put back "
+                                      f"without using an attempt, retrying in {CONNECT_RETRY_SECONDS}s.")
+                        break
+                try:
+                    smtp.send_message(msg)
+                    _mark_sent(conn, row_id, token)
+                    sent += 1
+                    logging.info(f"Email '{msg['Subject']}' delivered via {transport} ({key[:12]}).")
+                except Exception as e:
+                    status = _mark_failed(conn, row_id, token, attempts, e)
+                    failed += 1
+                    logging.error(f"Email delivery via {transport} failed ({key[:12]}, {status}): {e}")
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPAuthenticationError, OSError)):
+                        _close_quietly(smtp)
+                        smtp = None  # reconnect for the next message
+        finally:
+            if smtp is not None:
+                _close_quietly(smtp)
+    return sent, failed
+
+
+def drain(db_path=OUTBOX_DB, batch_size=BATCH_SIZE):
+    """Deliver everything that is currently due, then return."""
+    conn = connect(db_path)
+    try:
+        total_sent = total_failed = 0
+        while True:
+            token, rows = claim_batch(conn, batch_size)
+            if not rows:
+                return total_sent, total_failed
+            sent, failed = deliver_batch(conn, token, rows)
+            total_sent += sent
+            total_failed += failed
+    finally:
+        conn.close()
+
+
+def requeue_failed(db_path=OUTBOX_DB):
+    """Give messages that exhausted their retries another round of attempts."""
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'failed'",
+            (time.time(),)
+        )
+        logging.info(f"Requeued {cursor.rowcount} failed email(s).")
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def run_worker(db_path=OUTBOX_DB, poll_seconds=POLL_SECONDS, batch_size=BATCH_SIZE):
+    for transport in TRANSPORTS:
+        if transport != 'localhost' and not credentials_for(transport)[1]:
+            logging.warning(f"SMTP_{transport.upper()}_PASSWORD is not set; {transport} sends without login.")
+
+    print(f"📬 Outbox worker watching {db_path}...")
+    while True:
+        try:
+            sent, failed = drain(db_path, batch_size)
+            if sent or failed:
+                print(f"📧 Delivered {sent}, failed {failed}.")
+        except Exception as e:
+            logging.error(f"Outbox worker error: {e}")
+        time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Deliver queued report emails.")
+    parser.add_argument('--db', default=OUTBOX_DB)
+    parser.add_argument('--once', action='store_true', help="drain due messages and exit")
+    parser.add_argument('--requeue-failed', action='store_true', help="retry messages that exhausted their attempts")
+    args = parser.parse_args()
+
+    if args.requeue_failed:
+        print(f"🔁 Requeued {requeue_failed(args.db)} failed email(s).")
+    elif args.once:
+        sent, failed = drain(args.db)
+        print(f"📧 Delivered {sent}, failed {failed}.")
+    else:
+        run_worker(args.db)
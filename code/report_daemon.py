@@ -0,0 +1,367 @@
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from app1 import clean_data
+from appgmail import CHARTS, FRAME_CHART_DATA, PIVOT_SPEC
+from ingest import CSV_ENGINE, is_sharded, list_shards, read_shards
+from logconfig import setup_logging
+
+# ========================
+# CONFIGURATION
+# ========================
+
+INPUT_CSV = 'online_shoppers_intention.csv'
+HOST = '127.0.0.1'
+PORT = int(os.environ.get('REPORT_DAEMON_PORT', 8765))
+POLL_SECONDS = 2
+CACHE_SIZE = 128
+CACHE_MAX_BYTES = int(os.environ.get('REPORT_DAEMON_CACHE_BYTES', 256 * 1024 * 1024))
+
+AGGFUNCS = {'mean', 'sum', 'count', 'min', 'max', 'median'}
+
+# Matplotlib's pyplot state machine is not thread-safe
+_plot_lock = threading.Lock()
+
+
+# ========================
+# IN-MEMORY DATASET
+# ========================
+
+class DatasetStore:
+    """Keeps the cleaned dataset resident and reloads it when the CSV changes.
+
+    Rows appended to the end of the file are parsed and cleaned on their own
+    and concatenated; any other change triggers a full reload. When
+    ``filepath`` is a directory or glob of shards, only new or modified shards
+    are re-parsed. ``version`` increases on every reload and keys the result
+    cache.
+    """
+
+    TAIL_CHECK_BYTES = 4096
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.df = None
+        self.version = 0
+        self.loaded_at = None
+        self._offset = 0
+        self._tail = b''
+        self._stat = None
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return self.df, self.version
+
+    def refresh(self):
+        """Reload if the file changed. Returns True when the data changed."""
+        with self._lock:
+            try:
+                if is_sharded(self.filepath):
+                    changed = self._refresh_shards()
+                    if changed:
+                        self.version += 1
+                        self.loaded_at = datetime.now()
+                    return changed
+
+                stat = os.stat(self.filepath)
+                key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                if key == self._stat:
+                    return False
+
+                if self.df is not None and self._is_append(stat.st_size):
+                    changed = self._load_tail()
+                else:
+                    self._load_full()
+                    changed = True
+
+                self._stat = key
+                if changed:
+                    self.version += 1
+                    self.loaded_at = datetime.now()
+                return changed
+            except Exception as e:
+                logging.error(f"Daemon reload failed: {e}")
+                raise
+
+    def _is_append(self, size):
+        if size <= self._offset:
+            return False
+        start = self._offset - len(self._tail)
+        with open(self.filepath, 'rb') as f:
+            f.seek(start)
+            return f.read(len(self._tail)) == self._tail
+
+    def _remember_tail(self, data, end):
+        self._offset = end
+        self._tail = data[-self.TAIL_CHECK_BYTES:]
+
+    def _load_full(self):
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        # Same cut as _load_tail: a half-written last line is left for the next poll
+        cut = data.rfind(b'\n') + 1
+        complete = data[:cut] if cut else data
+        self.df = clean_data(pd.read_csv(io.BytesIO(complete), engine=CSV_ENGINE))
+        self._remember_tail(complete, len(complete))
+        logging.info(f"Daemon loaded {len(self.df)} rows from {self.filepath}.")
+
+    def _refresh_shards(self):
+        stats = {}
+        for path in list_shards(self.filepath):
+            stat = os.stat(path)
+            stats[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+        stale = [p for p, key in stats.items() if self._shards.get(p, (None,))[0] != key]
+        removed = [p for p in self._shards if p not in stats]
+        if not stale and not removed:
+            return False
+
+        for path in removed:
+            del self._shards[path]
+        for path, df in read_shards(stale).items():
+            self._shards[path] = (stats[path], clean_data(df))
+
+        self.df = pd.concat([self._shards[p][1] for p in sorted(self._shards)], ignore_index=True)
+        logging.info(f"Daemon reloaded {len(stale)} shard(s), removed {len(removed)}; {len(self.df)} rows total.")
+        return True
+
+    def _load_tail(self):
+        with open(self.filepath, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+
+        # Leave a partially written last line for the next poll
+        complete = data[:data.rfind(b'\n') + 1]
+        if not complete.strip():
+            return False
+
+        new_rows = pd.read_csv(io.BytesIO(complete), header=None, names=list(self.df.columns),
+                               engine=CSV_ENGINE)
+        new_rows = clean_data(new_rows)
+        self.df = pd.concat([self.df, new_rows], ignore_index=True)
+        self._remember_tail(self._tail + complete, self._offset + len(complete))
+        logging.info(f"Daemon appended {len(new_rows)} new rows.")
+        return True
+
+
+# ========================
+# RESULT CACHE
+# ========================
+
+class ResultCache:
+    """LRU cache of ``(body, content_type)`` results, bounded by entries and bytes."""
+
+    def __init__(self, maxsize=CACHE_SIZE, max_bytes=CACHE_MAX_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        size = len(value[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= len(self._items.pop(key)[0])
+            self._items[key] = value
+            self.nbytes += size
+            while len(self._items) > self.maxsize or self.nbytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+# ========================
+# REPORT BUILDERS
+# ========================
+
+def _split(params, name, default):
+    value = params.get(name, [default])[0]
+    return [v for v in value.split(',') if v]
+
+
+def build_pivot(df, params):
+    index = _split(params, 'index', 'VisitorType')
+    columns = _split(params, 'columns', 'Weekend')
+    values = _split(params, 'values', 'PageValues')
+    aggfunc = _split(params, 'aggfunc', 'mean')
+
+    unknown = [c for c in index + columns + values if c not in df.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    bad_funcs = [a for a in aggfunc if a not in AGGFUNCS]
+    if bad_funcs:
+        raise ValueError(f"Unsupported aggfunc: {', '.join(bad_funcs)}")
+
+    pivot = pd.pivot_table(
+        df,
+        values=values,
+        index=index,
+        columns=columns or None,
+        aggfunc=aggfunc if len(aggfunc) > 1 else aggfunc[0],
+        fill_value=0
+    )
+    if params.get('format', ['json'])[0] == 'csv':
+        return pivot.to_csv().encode('utf-8'), 'text/csv'
+    return pivot.to_json(orient='split').encode('utf-8'), 'application/json'
+
+
+def build_chart(df, params):
+    name = params.get('name', [''])[0]
+    if name not in CHARTS:
+        raise ValueError(f"Unknown chart '{name}'. Available: {', '.join(CHARTS)}")
+
+    # Same charts as the emailed report (appgmail.CHARTS)
+    key, plot_func = CHARTS[name]
+    buffer = io.BytesIO()
+    with _plot_lock:
+        sns.set(style="whitegrid")
+        plt.figure(figsize=(8, 6))
+        plot_func(FRAME_CHART_DATA[key](df))
+        plt.tight_layout()
+        plt.savefig(buffer, format='png')
+        plt.close()
+    return buffer.getvalue(), 'image/png'
+
+
+def build_report(df, params):
+    sorted_df = df.sort_values(by='BounceRates', ascending=False) if 'BounceRates' in df.columns else df
+    pivot = pd.pivot_table(df, **PIVOT_SPEC)
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        sorted_df.to_excel(writer, index=False, sheet_name='Sorted_Data')
+        pivot.to_excel(writer, sheet_name='Pivot_Insights')
+    return buffer.getvalue(), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+ROUTES = {
+    '/pivot': build_pivot,
+    '/chart': build_chart,
+    '/report': build_report,
+}
+
+
+# ========================
+# HTTP SERVER
+# ========================
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    store = None
+    cache = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        df, version = self.store.snapshot()
+
+        if url.path == '/health':
+            body = json.dumps({
+                'rows': 0 if df is None else len(df),
+                'version': version,
+                'loaded_at': self.store.loaded_at.isoformat() if self.store.loaded_at else None,
+            }).encode('utf-8')
+            return self._respond(200, body, 'application/json')
+
+        builder = ROUTES.get(url.path)
+        if builder is None:
+            return self._respond(404, b'Not found', 'text/plain')
+
+        key = (version, url.path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._respond(200, *cached)
+
+        try:
+            start = time.perf_counter()
+            result = builder(df, params)
+            logging.info(f"Daemon built {url.path} in {time.perf_counter() - start:.3f}s.")
+        except ValueError as e:
+            return self._respond(400, str(e).encode('utf-8'), 'text/plain')
+        except Exception as e:
+            logging.error(f"Daemon request {self.path} failed: {e}")
+            return self._respond(500, b'Internal error', 'text/plain')
+
+        self.cache.put(key, result)
+        self._respond(200, *result)
+
+    def _respond(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Daemon %s - %s", self.address_string(), format % args)
+
+
+def watch_for_changes(store, cache, stop_event, interval=POLL_SECONDS):
+    while not stop_event.wait(interval):
+        try:
+            if store.refresh():
+                cache.clear()
+        except Exception:
+            pass  # already logged; keep serving the last good data
+
+
+def run_daemon(filepath=INPUT_CSV, host=HOST, port=PORT):
+    store = DatasetStore(filepath)
+    cache = ResultCache()
+    store.refresh()
+
+    ReportRequestHandler.store = store
+    ReportRequestHandler.cache = cache
+    server = ThreadingHTTPServer((host, port), ReportRequestHandler)
+
+    stop_event = threading.Event()
+    watcher = threading.Thread(target=watch_for_changes, args=(store, cache, stop_event), daemon=True)
+    watcher.start()
+
+    print(f"🚀 Report daemon serving {filepath} on http://{host}:{port} (/pivot, /chart, /report, /health)")
+    logging.info(f"Report daemon started on {host}:{port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Stopping report daemon...")
+    finally:
+        stop_event.set()
+        server.server_close()
+        logging.info("Report daemon stopped.")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    # Optional argument: a CSV file, a glob or a directory of shards
+    run_daemon(sys.argv[1] if len(sys.argv) > 1 else INPUT_CSV)
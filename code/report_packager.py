@@ -0,0 +1,260 @@
+import io
+import logging
+import math
+import os
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import pandas as pd
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ========================
+# CONFIGURATION
+# ========================
+
+# Gmail and Outlook reject messages above 25 MB / 20 MB after base64 encoding
+MAX_MESSAGE_BYTES = int(os.environ.get('REPORT_MAX_EMAIL_BYTES', 18 * 1024 * 1024))
+MESSAGE_OVERHEAD_BYTES = 64 * 1024   # headers, body and MIME boundaries
+EXCEL_SAMPLE_ROWS = 500              # rows written in memory to estimate workbook size and writer memory
+WRITER_RSS_FACTOR = 1.5              # RSS grows more than tracemalloc sees (allocator slack)
+MIN_SAVING = 0.05                    # keep a compressed copy only if it is at least 5% smaller
+SUMMARY_TOP_ROWS = 1000              # rows of the sorted data kept when the full sheet is left out
+
+# .xlsx is not listed: it is already a deflated zip, and zipping it again
+# only makes recipients unpack it before they can open it
+COMPRESSIBLE = {'.csv', '.txt'}
+MIME_TYPES = {
+    '.png': ('image', 'png'),
+    '.zip': ('application', 'zip'),
+    '.xlsx': ('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def encoded_size(raw_size):
+    """Size of a payload after base64 encoding with 76-character lines."""
+    b64 = 4 * math.ceil(raw_size / 3)
+    return b64 + 2 * math.ceil(b64 / 76)
+
+
+# ========================
+# EXCEL REPORT
+# ========================
+
+def _write_sample(sample):
+    # Returns (file bytes, peak bytes allocated while writing)
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            sample.to_excel(writer, index=False)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if started:
+            tracemalloc.stop()
+    return len(buffer.getvalue()), peak
+
+
+def estimate_excel_cost(df, sample_rows=EXCEL_SAMPLE_ROWS):
+    """Estimate ``(file_bytes, writer_bytes)`` for writing ``df`` to .xlsx.
+
+    openpyxl keeps every cell in memory until the workbook is saved, so the
+    writer's memory grows with the row count like the file does. Two samples
+    are written in memory, and the difference between them gives the
+    per-row cost without the workbook's fixed overhead.
+    """
+    if df.empty:
+        return 0, 0
+    if len(df) <= sample_rows:
+        size, peak = _write_sample(df)
+        return size, int(peak * WRITER_RSS_FACTOR)
+    _write_sample(df.head(1))  # the first write imports openpyxl's modules; keep that out of the samples
+    small_rows = sample_rows // 5
+    small_size, small_peak = _write_sample(df.head(small_rows))
+    size, peak = _write_sample(df.head(sample_rows))
+    scale = (len(df) - sample_rows) / (sample_rows - small_rows)
+    writer_bytes = (peak + max(peak - small_peak, 0) * scale) * WRITER_RSS_FACTOR
+    return int(size + max(size - small_size, 0) * scale), int(writer_bytes)
+
+
+def summary_sheets(top_rows, total_rows, reason):
+    """Sheets written in place of an oversized ``Sorted_Data``.
+
+    ``Top_Rows`` keeps the head of the sorted data and ``Report_Notes`` says
+    what was left out; ``Pivot_Insights`` still summarises every row.
+    """
+    return {
+        'Report_Notes': pd.DataFrame({'Note': [
+            f"The full dataset ({total_rows} rows) was left out {reason}.",
+            f"Top_Rows holds the first {len(top_rows)} rows of the sorted data.",
+            "Pivot_Insights summarises every row.",
+        ]}),
+        'Top_Rows': top_rows,
+    }
+
+
+def _write_summary_sheets(writer, top_rows, total_rows, reason):
+    for name, sheet in summary_sheets(top_rows, total_rows, reason).items():
+        sheet.to_excel(writer, sheet_name=name, index=False)
+
+
+def save_summary_excel(top_rows, pivot, total_rows, file_path):
+    """Write the summary sheets and pivot, for input that was streamed in chunks."""
+    try:
+        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+            _write_summary_sheets(writer, top_rows, total_rows, "because it exceeded the memory budget")
+            pivot.to_excel(writer, sheet_name='Pivot_Insights')
+        logging.info(f"Excel summary report saved ({os.path.getsize(file_path) / 2**20:.1f} MB).")
+    except Exception as e:
+        logging.error(f"Error saving Excel report: {e}")
+        raise
+
+
+def save_report_excel(sorted_df, pivot, file_path, max_bytes=MAX_MESSAGE_BYTES, max_memory=None):
+    """Write the sorted data and pivot to Excel, summarising the data if it is too big.
+
+    The workbook size and the writer's memory are estimated from samples
+    before anything is written. If the data sheet would push the email over
+    ``max_bytes``, or the writer would need more than ``max_memory`` bytes,
+    ``Sorted_Data`` is replaced by its first ``SUMMARY_TOP_ROWS`` rows and a
+    note; ``Pivot_Insights`` is always kept in full.
+    """
+    try:
+        estimate, writer_bytes = estimate_excel_cost(sorted_df)
+        if encoded_size(estimate) + MESSAGE_OVERHEAD_BYTES > max_bytes:
+            reason = "to keep this email under the size limit"
+        elif max_memory is not None and writer_bytes > max_memory:
+            reason = "because writing it would exceed the memory budget"
+        else:
+            reason = None
+
+        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+            if reason:
+                _write_summary_sheets(writer, sorted_df.head(SUMMARY_TOP_ROWS), len(sorted_df), reason)
+            else:
+                sorted_df.to_excel(writer, index=False, sheet_name='Sorted_Data')
+            pivot.to_excel(writer, sheet_name='Pivot_Insights')
+
+        size = os.path.getsize(file_path) / 2**20
+        if reason:
+            logging.info(f"Sorted_Data would be ~{estimate / 2**20:.1f} MB and need ~{writer_bytes / 2**20:.0f} MB "
+                         f"to write; wrote the top {SUMMARY_TOP_ROWS} rows instead ({size:.1f} MB).")
+        else:
+            logging.info(f"Excel report saved ({size:.1f} MB).")
+    except Exception as e:
+        logging.error(f"Error saving Excel report: {e}")
+        raise
+
+
+# ========================
+# ATTACHMENT PREPARATION
+# ========================
+
+def optimize_png(data):
+    """Losslessly recompress a PNG; returns the input unchanged without Pillow."""
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        if img.mode == 'RGBA' and img.getextrema()[3] == (255, 255):
+            img = img.convert('RGB')  # matplotlib writes an opaque alpha channel
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def compress_file(filename, data):
+    """Deflate a payload into a single-member zip archive."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        archive.writestr(filename, data)
+    return buffer.getvalue()
+
+
+def prepare_attachment(path):
+    """Return ``(filename, payload)`` with the smallest encoding worth sending."""
+    filename = os.path.basename(path)
+    ext = os.path.splitext(filename)[1].lower()
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if ext == '.png':
+        optimized = optimize_png(data)
+    elif ext in COMPRESSIBLE:
+        optimized = compress_file(filename, data)
+    else:
+        optimized = data
+
+    if len(optimized) <= len(data) * (1 - MIN_SAVING):
+        if ext in COMPRESSIBLE:
+            filename += '.zip'
+        logging.info(f"Attachment {filename}: {len(data) / 1024:.0f} KB -> {len(optimized) / 1024:.0f} KB.")
+        return filename, optimized
+    return filename, data
+
+
+def prepare_attachments(paths, max_workers=None):
+    """Optimise/compress all attachments concurrently (zlib releases the GIL)."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(prepare_attachment, paths))
+
+
+# ========================
+# MESSAGE PACKAGING
+# ========================
+
+def split_into_batches(attachments, max_bytes=MAX_MESSAGE_BYTES):
+    """Group attachments so each message stays under ``max_bytes`` once encoded.
+
+    First-fit decreasing: largest attachments are placed first, each into the
+    first message with room. An attachment that is too big on its own gets a
+    message to itself and is logged.
+    """
+    budget = max_bytes - MESSAGE_OVERHEAD_BYTES
+    batches = []
+    for filename, data in sorted(attachments, key=lambda a: len(a[1]), reverse=True):
+        size = encoded_size(len(data))
+        if size > budget:
+            logging.error(f"Attachment {filename} is {size / 2**20:.1f} MB encoded, over the message limit.")
+        for batch in batches:
+            if batch['size'] + size <= budget:
+                batch['items'].append((filename, data))
+                batch['size'] += size
+                break
+        else:
+            batches.append({'items': [(filename, data)], 'size': size})
+    return [batch['items'] for batch in batches]
+
+
+def build_messages(sender, recipients, subject, body, paths, max_bytes=MAX_MESSAGE_BYTES):
+    """Prepare the attachments and package them into one or more size-bounded emails."""
+    try:
+        batches = split_into_batches(prepare_attachments(paths), max_bytes)
+        messages = []
+        for number, batch in enumerate(batches, start=1):
+            msg = EmailMessage()
+            msg['From'] = sender
+            msg['To'] = ', '.join(recipients)
+            msg['Subject'] = subject if len(batches) == 1 else f"{subject} ({number}/{len(batches)})"
+            msg.set_content(body)
+
+            for filename, data in batch:
+                maintype, subtype = MIME_TYPES.get(os.path.splitext(filename)[1].lower(),
+                                                   ('application', 'octet-stream'))
+                msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+            messages.append(msg)
+
+        logging.info(f"Packaged {len(paths)} attachment(s) into {len(messages)} message(s).")
+        return messages
+    except Exception as e:
+        logging.error(f"Error packaging email attachments: {e}")
+        raise
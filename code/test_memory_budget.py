@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import memory_budget
+from memory_budget import MemoryBudget
+
+CHUNK_ROWS = 250
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 2000
+    df = pd.DataFrame({
+        'VisitorType': rng.choice(['New_Visitor', 'Returning_Visitor', 'Other'], rows),
+        'Weekend': rng.choice([True, False], rows),
+        'Month': rng.choice(['Feb', 'Mar', 'May', 'Nov'], rows),
+        'PageValues': rng.exponential(10, rows).round(3),
+        'BounceRates': rng.uniform(0, 0.2, rows).round(4),
+        'Administrative': rng.integers(0, 20, rows),
+    })
+    df.loc[rng.choice(rows, 100, replace=False), 'PageValues'] = np.nan
+    path = tmp_path / 'input.csv'
+    df.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    budget = MemoryBudget('1GB')
+    monkeypatch.setattr(memory_budget, 'MIN_CHUNK_ROWS', CHUNK_ROWS)
+    monkeypatch.setattr(budget, '_chunk_rows', lambda bytes_per_row: CHUNK_ROWS)
+    return budget
+
+
+@pytest.mark.parametrize('aggfunc', ['mean', 'sum', 'count', 'min', 'max', ['mean', 'sum', 'count']])
+@pytest.mark.parametrize('columns', [None, 'Weekend'])
+def test_pivot_matches_pivot_table(csv_path, budget, aggfunc, columns):
+    kwargs = dict(values=['PageValues', 'BounceRates'], index=['VisitorType', 'Month'],
+                  columns=columns, aggfunc=aggfunc)
+    expected = pd.pivot_table(pd.read_csv(csv_path), **kwargs)
+    pd.testing.assert_frame_equal(budget.pivot(str(csv_path), **kwargs), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('index', ['Month', 'BounceRates'])
+def test_pivot_matches_after_spilling(csv_path, budget, monkeypatch, tmp_path, index):
+    monkeypatch.setattr(memory_budget, 'SPILL_FRACTION', 0)
+    monkeypatch.setattr(memory_budget.tempfile, 'tempdir', str(tmp_path))
+    kwargs = dict(values='PageValues', index=index, columns='VisitorType', aggfunc=['mean', 'min'], fill_value=0)
+    expected = pd.pivot_table(pd.read_csv(csv_path), **kwargs)
+    pd.testing.assert_frame_equal(budget.pivot(str(csv_path), **kwargs), expected, check_dtype=False)
+    assert not list(tmp_path.glob('pivot_spill_*'))
+
+
+@pytest.mark.parametrize('aggfunc', ['mean', 'max', ['mean', 'sum', 'count', 'min']])
+@pytest.mark.parametrize('index', ['Month', ['VisitorType', 'Weekend']])
+def test_pivot_margins(csv_path, budget, aggfunc, index):
+    kwargs = dict(values=['PageValues', 'BounceRates'], index=index,
+                  aggfunc=aggfunc, margins=True, margins_name='Grand Total')
+    expected = pd.pivot_table(pd.read_csv(csv_path), **kwargs)
+    pd.testing.assert_frame_equal(budget.pivot(str(csv_path), **kwargs), expected, check_dtype=False)
+
+
+def test_pivot_rejects_unsupported_aggfunc(csv_path, budget):
+    with pytest.raises(ValueError):
+        budget.pivot(str(csv_path), values='PageValues', index='Month', aggfunc='median')
+
+
+def test_corr_matches_dataframe_corr(csv_path, budget):
+    expected = pd.read_csv(csv_path).corr(numeric_only=True)
+    pd.testing.assert_frame_equal(budget.corr(str(csv_path)), expected, atol=1e-12)
+
+
+def test_sum_over_chunks(csv_path, budget):
+    df = pd.read_csv(csv_path)
+    totals = budget.sum_over_chunks(str(csv_path), lambda chunk: {
+        'missing': chunk.isnull().sum(),
+        'visitors': chunk['VisitorType'].value_counts(),
+    })
+    pd.testing.assert_series_equal(totals['missing'], df.isnull().sum(), check_dtype=False)
+    pd.testing.assert_series_equal(totals['visitors'].sort_index(), df['VisitorType'].value_counts().sort_index(),
+                                   check_dtype=False)
+
+
+def test_stage_records_peak_inside_the_stage():
+    budget = MemoryBudget('1GB')
+    with budget.stage('spike'):
+        start = memory_budget.current_rss()
+        spike = np.ones(200 * 2**20 // 8)
+        del spike
+    assert budget.peak_rss >= start + 150 * 2**20
@@ -0,0 +1,88 @@
+import smtplib
+import time
+from email.message import EmailMessage
+
+import pytest
+
+import outbox
+
+
+def make_message(number):
+    msg = EmailMessage()
+    msg['From'] = 'sender@gmail.com'
+    msg['To'] = 'receiver@gmail.com'
+    msg['Subject'] = f"Report {number}"
+    msg.set_content("Attached is today's report.")
+    return msg
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'outbox.sqlite3')
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = outbox.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def enqueue(db_path, count):
+    for number in range(count):
+        outbox.enqueue_message(make_message(number), transport='gmail', db_path=db_path)
+
+
+def row_state(conn):
+    return conn.execute("SELECT status, attempts, lease_token FROM outbox ORDER BY id").fetchall()
+
+
+def test_claim_batch_leases_due_rows_once(db_path, conn):
+    enqueue(db_path, 3)
+    conn.execute("UPDATE outbox SET next_attempt_at = ? WHERE id = 3", (time.time() + 60,))
+
+    token, rows = outbox.claim_batch(conn)
+
+    assert [row[0] for row in rows] == [1, 2]
+    assert [row[4] for row in rows] == [1, 1]
+    assert row_state(conn) == [('sending', 1, token), ('sending', 1, token), ('pending', 0, None)]
+    assert outbox.claim_batch(conn)[1] == []
+
+
+def test_renew_lease_fails_after_takeover(db_path, conn):
+    enqueue(db_path, 1)
+    stale_token, _ = outbox.claim_batch(conn, lease_seconds=-1)
+    token, rows = outbox.claim_batch(conn)
+
+    assert rows[0][4] == 2
+    assert not outbox._renew_lease(conn, 1, stale_token)
+    outbox._mark_sent(conn, 1, stale_token)
+    assert row_state(conn) == [('sending', 2, token)]
+    assert outbox._renew_lease(conn, 1, token)
+
+
+def test_expired_lease_with_exhausted_attempts_is_failed(db_path, conn):
+    enqueue(db_path, 1)
+    for _ in range(outbox.MAX_ATTEMPTS):
+        _, rows = outbox.claim_batch(conn, lease_seconds=-1)
+        assert len(rows) == 1
+
+    assert outbox.claim_batch(conn)[1] == []
+    assert row_state(conn)[0][:2] == ('failed', outbox.MAX_ATTEMPTS)
+
+
+def test_connect_failure_puts_rows_back_without_using_attempts(db_path, conn, monkeypatch):
+    logins = []
+
+    def failing_open_smtp(transport, user, password):
+        logins.append(transport)
+        raise smtplib.SMTPAuthenticationError(535, b'Username and Password not accepted')
+
+    monkeypatch.setattr(outbox, 'open_smtp', failing_open_smtp)
+    enqueue(db_path, 3)
+    token, rows = outbox.claim_batch(conn)
+
+    assert outbox.deliver_batch(conn, token, rows) == (0, 0)
+    assert logins == ['gmail']
+    assert [state[:2] for state in row_state(conn)] == [('pending', 0)] * 3
+    assert outbox.claim_batch(conn)[1] == []